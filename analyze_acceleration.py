@@ -1,10 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
+
+from plotting import pyplot
 
 def process_acceleration_data(filename):
+    import pandas as pd
+
     # Read CSV file
     df = pd.read_csv(filename)
 
@@ -35,6 +35,8 @@ def process_acceleration_data(filename):
     return timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance
 
 def create_plots(timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance):
+    plt = pyplot()
+
     # Plot 1: Acceleration
     plt.figure(figsize=(10, 6))
     plt.plot(timestamps, acceleration, label='Actual Acceleration', linewidth=2)
@@ -76,12 +78,13 @@ def create_plots(timestamps, acceleration, noisy_acceleration, velocity, noisy_v
 
     print("Plots saved: plot1_acceleration.png, plot2_velocity.png, plot3_distance.png")
 
-def main():
+def main(filename='lab9-dataset/ACCELERATION.csv', plots=True):
     # Process the data
-    timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance = process_acceleration_data('lab9-dataset/ACCELERATION.csv')
+    timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance = process_acceleration_data(filename)
 
     # Create plots
-    create_plots(timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance)
+    if plots:
+        create_plots(timestamps, acceleration, noisy_acceleration, velocity, noisy_velocity, distance, noisy_distance)
 
     # Calculate final distances
     final_distance_actual = distance[-1]
@@ -0,0 +1,127 @@
+import numpy as np
+
+from stages import load_recording
+
+# Batched kernels for many equal-length recordings at the same rate.
+# Recordings are stacked into (N, T) arrays and every stage is a single NumPy
+# or SciPy call along axis 1. Peak and turn detection produce a different
+# number of events per row, returned as (offsets, values) where the events of
+# row i are values[offsets[i]:offsets[i+1]].
+
+def stack_recordings(filenames, columns=('timestamp', 'accel_x', 'accel_y', 'accel_z', 'gyro_z')):
+    recordings = [load_recording(filename) for filename in filenames]
+    lengths = {len(recording['timestamp']) for recording in recordings}
+    if len(lengths) != 1:
+        raise ValueError(f"recordings must have equal length, got lengths {sorted(lengths)}")
+    return {column: np.stack([recording[column] for recording in recordings]) for column in columns}
+
+def ragged_row(offsets, values, i):
+    return values[offsets[i]:offsets[i + 1]]
+
+def batch_sampling_rate(timestamps, rate_tolerance=0.01):
+    # One rate for the whole batch, since the filters are designed once
+    rates = 1.0 / (np.mean(np.diff(timestamps, axis=1), axis=1) / 1e9)
+    fs = np.mean(rates)
+    if np.any(np.abs(rates - fs) > rate_tolerance * fs):
+        raise ValueError(f"sampling rates differ by more than {rate_tolerance:.0%}: "
+                         f"{rates.min():.2f}-{rates.max():.2f} Hz")
+    return fs
+
+def rate_bucket(timestamps, rate_tolerance=0.01):
+    # Recordings in the same bucket differ in rate by less than rate_tolerance,
+    # so a group built from one bucket always passes batch_sampling_rate
+    fs = 1.0 / (np.mean(np.diff(timestamps)) / 1e9)
+    return int(np.round(np.log(fs) / np.log1p(rate_tolerance)))
+
+def batch_magnitude(x, y, z):
+    return np.sqrt(x**2 + y**2 + z**2)
+
+def batch_lowpass(data, cutoff_freq, sampling_rate, order=4):
+    # Zero-phase Butterworth low-pass in second-order sections, applied to
+    # every row at once. Matches lowpass_filter up to filter round-off.
+    from scipy.signal import butter, sosfiltfilt
+
+    nyquist = 0.5 * sampling_rate
+    sos = butter(order, cutoff_freq / nyquist, btype='low', analog=False, output='sos')
+    return sosfiltfilt(sos, data, axis=1)
+
+def batch_integrate(values, timestamps):
+    # Left-rectangle integration matching the per-file loops:
+    # out[:, i] = sum of values[:, k] * dt[:, k] for k < i
+    dt = np.diff(timestamps, axis=1) / 1e9
+    out = np.zeros(values.shape)
+    np.cumsum(values[:, :-1] * dt, axis=1, out=out[:, 1:])
+    return out
+
+def batch_heading(filtered_gyro_z, timestamps):
+    # Cumulative heading in degrees for every row
+    return np.degrees(batch_integrate(filtered_gyro_z, timestamps))
+
+def batch_step_peaks(filtered_accel, sampling_rate, height_std=0.5, min_step_interval=0.3):
+    from scipy.signal import find_peaks
+
+    # Thresholds for every row in one call; find_peaks itself is 1-D only
+    min_peak_height = np.mean(filtered_accel, axis=1) + height_std * np.std(filtered_accel, axis=1)
+    min_distance = int(min_step_interval * sampling_rate)
+
+    peaks = [find_peaks(row, height=height, distance=min_distance)[0]
+             for row, height in zip(filtered_accel, min_peak_height)]
+    offsets = np.zeros(len(peaks) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in peaks], out=offsets[1:])
+    values = np.concatenate(peaks) if peaks else np.zeros(0, dtype=np.int64)
+    return offsets, values.astype(np.int64)
+
+def _row_turns(angle_deg, min_gap, turn_threshold):
+    # Same rule as detect_turns: the next turn is the first sample more than
+    # min_gap samples after the previous one whose angle differs from the
+    # angle at the previous turn by at least turn_threshold degrees.
+    indices = []
+    angles = []
+    start = 0
+    while True:
+        first = int(np.floor(start + min_gap)) + 1
+        if first >= len(angle_deg):
+            break
+        change = angle_deg[first:] - angle_deg[start]
+        hits = np.flatnonzero(np.abs(change) >= turn_threshold)
+        if len(hits) == 0:
+            break
+        start = first + hits[0]
+        indices.append(start)
+        angles.append(change[hits[0]])
+    return indices, angles
+
+def batch_turns(heading_deg, sampling_rate, turn_threshold=85, min_turn_interval=0.5):
+    # Returns (offsets, indices, angles); a positive angle is a clockwise turn
+    min_gap = min_turn_interval * sampling_rate
+    rows = [_row_turns(row, min_gap, turn_threshold) for row in heading_deg]
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices, _ in rows], out=offsets[1:])
+    indices = np.array([i for row_indices, _ in rows for i in row_indices], dtype=np.int64)
+    angles = np.array([a for _, row_angles in rows for a in row_angles], dtype=np.float64)
+    return offsets, indices, angles
+
+def process_batch(filenames, step_cutoff=3.0, turn_cutoff=1.0):
+    # Step and turn detection for equal-length recordings in one pass
+    data = stack_recordings(filenames)
+    timestamps = data['timestamp']
+    fs = batch_sampling_rate(timestamps)
+
+    accel_mag = batch_magnitude(data['accel_x'], data['accel_y'], data['accel_z'])
+    filtered_accel = batch_lowpass(accel_mag, step_cutoff, fs)
+    step_offsets, step_indices = batch_step_peaks(filtered_accel, fs)
+
+    filtered_gyro_z = batch_lowpass(data['gyro_z'], turn_cutoff, fs)
+    heading_deg = batch_heading(filtered_gyro_z, timestamps)
+    turn_offsets, turn_indices, turn_angles = batch_turns(heading_deg, fs)
+
+    return {
+        'sampling_rate': fs,
+        'heading_deg': heading_deg,
+        'step_offsets': step_offsets,
+        'step_indices': step_indices,
+        'turn_offsets': turn_offsets,
+        'turn_indices': turn_indices,
+        'turn_angles': turn_angles,
+    }
@@ -0,0 +1,100 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Startup-time budget check for pdr.py using `python -X importtime`.
+# Each scenario runs in a fresh interpreter. Import time is split into the
+# numeric/plotting libraries (numpy, pandas, scipy, ...), including everything
+# they pull in, and the rest: pdr.py, the analysis modules and the standard
+# library they use. The rest has a tight budget, since it is what the CLI
+# controls; the total only has a loose one, as the library cost varies a lot
+# between machines, which still catches a scenario pulling in a heavy library
+# it did not load before. --scale multiplies both. The check also fails if a
+# scenario exits with an error or imports a module it should not need.
+
+PDR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdr.py')
+
+# Libraries whose import cost only counts towards the total budget
+LIBRARIES = {'numpy', 'pandas', 'scipy', 'matplotlib', 'numba', 'reportlab'}
+
+# (name, pdr arguments, budget in ms for non-library imports, budget in ms for
+#  all imports, modules that must not be imported)
+SCENARIOS = [
+    ('help', ['--help'], 50, 100, ['numpy', 'pandas', 'scipy', 'matplotlib', 'numba']),
+    ('steps --no-plots', ['steps', '--no-plots'], 150, 2500, ['matplotlib', 'numba']),
+    ('turns --no-plots', ['turns', '--no-plots'], 150, 2500, ['matplotlib', 'numba']),
+    ('trajectory --no-plots', ['trajectory', '--no-plots'], 150, 2500, ['matplotlib', 'numba']),
+    ('accel --no-plots', ['accel', '--no-plots'], 150, 2000, ['matplotlib', 'scipy', 'numba']),
+    ('montecarlo --no-plots', ['montecarlo', '--no-plots', '--realisations', '1000', '--workers', '1'],
+     150, 2000, ['matplotlib', 'scipy', 'numba']),
+    ('batch', ['batch'], 200, 2500, ['matplotlib', 'numba']),
+    ('batch --batched', ['batch', '--batched'], 200, 2500, ['matplotlib', 'numba']),
+]
+
+def parse_importtime(stderr):
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    # and are printed children first, indented two spaces per nesting level.
+    # Walking them in reverse visits each parent before its children, so a
+    # module counts as library time when it or any ancestor is a library.
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, int(self_us), name.strip()))
+
+    own_us = library_us = 0
+    modules = set()
+    stack = []  # (depth, inside a library) for the current ancestors
+    for depth, self_us, name in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        package = name.split('.')[0]
+        in_library = package in LIBRARIES or (bool(stack) and stack[-1][1])
+        stack.append((depth, in_library))
+        if in_library:
+            library_us += self_us
+        else:
+            own_us += self_us
+        modules.add(package)
+    return own_us / 1000.0, library_us / 1000.0, modules
+
+def run_scenario(pdr_args):
+    result = subprocess.run([sys.executable, '-X', 'importtime', PDR] + pdr_args,
+                            capture_output=True, text=True, cwd=os.path.dirname(PDR))
+    own_ms, library_ms, modules = parse_importtime(result.stderr)
+    return result.returncode, own_ms, library_ms, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Check pdr.py import-time budgets')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply every budget, e.g. 2 on slow CI machines')
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'scenario':<24} {'own (ms)':>10} {'budget':>8} {'total (ms)':>11} {'budget':>8}  status")
+    for name, pdr_args, budget_ms, total_budget_ms, forbidden in SCENARIOS:
+        returncode, own_ms, library_ms, modules = run_scenario(pdr_args)
+        budget_ms *= args.scale
+        total_budget_ms *= args.scale
+        total_ms = own_ms + library_ms
+
+        problems = []
+        if returncode != 0:
+            problems.append(f"exit status {returncode}")
+        if own_ms > budget_ms:
+            problems.append("over budget")
+        if total_ms > total_budget_ms:
+            problems.append("over total budget")
+        problems.extend(f"imported {module}" for module in forbidden if module in modules)
+
+        failures += bool(problems)
+        status = ', '.join(problems) if problems else 'ok'
+        print(f"{name:<24} {own_ms:>10.1f} {budget_ms:>8.0f} {total_ms:>11.1f} {total_budget_ms:>8.0f}  {status}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
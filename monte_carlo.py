@@ -0,0 +1,195 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from plotting import pyplot
+
+# Monte Carlo error propagation for double integration of acceleration.
+# Realisations of the clean ACCELERATION.csv profile are drawn as (n, T)
+# arrays with white noise, a constant bias and a linear bias drift, then
+# integrated together the same way as process_acceleration_data. Errors are
+# accumulated into fixed per-time-step histograms, so memory is bounded by
+# the chunk size and the number of bins, not by the number of realisations.
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+def load_profile(filename):
+    import pandas as pd
+
+    df = pd.read_csv(filename)
+    timestamps = df['timestamp'].values
+    acceleration = df['acceleration'].values
+    # The residual of the recorded noisy signal gives the white noise level
+    residual = df['noisyacceleration'].values - acceleration
+    return timestamps, acceleration, float(np.std(residual))
+
+def integrate(acceleration, dt):
+    # v[i] = v[i-1] + a[i-1]*dt and d[i] = d[i-1] + v[i-1]*dt along the last axis
+    velocity = np.zeros(acceleration.shape)
+    distance = np.zeros(acceleration.shape)
+    np.cumsum(acceleration[..., :-1] * dt, axis=-1, out=velocity[..., 1:])
+    np.cumsum(velocity[..., :-1] * dt, axis=-1, out=distance[..., 1:])
+    return velocity, distance
+
+def draw_realisations(rng, n, timestamps, acceleration, noise_std, bias_std, drift_std):
+    t = timestamps - timestamps[0]
+    bias = rng.normal(0.0, bias_std, size=(n, 1))
+    drift = rng.normal(0.0, drift_std, size=(n, 1))
+    realisations = rng.normal(0.0, noise_std, size=(n, len(t)))
+    realisations += acceleration + bias + drift * t
+    return realisations
+
+def _histogram(errors, lo, width, n_bins):
+    # Counts per (time step, bin) for a (n, T) block, values outside the
+    # range land in the edge bins
+    n, T = errors.shape
+    bins = np.floor((errors - lo) / width).astype(np.int64)
+    clipped = int(np.count_nonzero((bins < 0) | (bins >= n_bins)))
+    np.clip(bins, 0, n_bins - 1, out=bins)
+    bins += np.arange(T) * n_bins
+    counts = np.bincount(bins.ravel(), minlength=T * n_bins).reshape(T, n_bins)
+    return counts, clipped
+
+def _run_chunk(task):
+    (seed, n, timestamps, acceleration, clean_velocity, clean_distance,
+     noise_std, bias_std, drift_std, ranges, n_bins) = task
+    rng = np.random.default_rng(seed)
+    dt = timestamps[1] - timestamps[0]
+
+    realisations = draw_realisations(rng, n, timestamps, acceleration, noise_std, bias_std, drift_std)
+    velocity, distance = integrate(realisations, dt)
+    velocity -= clean_velocity
+    distance -= clean_distance
+
+    result = {'n': n}
+    for name, errors in (('velocity', velocity), ('distance', distance)):
+        lo, width = ranges[name]
+        counts, clipped = _histogram(errors, lo, width, n_bins)
+        result[name] = {'counts': counts, 'clipped': clipped,
+                        'sum': errors.sum(axis=0), 'sumsq': np.square(errors).sum(axis=0)}
+    return result
+
+def _bin_ranges(errors, n_bins, margin=0.5):
+    # Per time step bin edges from a pilot run, padded on both sides
+    lo = errors.min(axis=0)
+    hi = errors.max(axis=0)
+    pad = margin * (hi - lo)
+    lo = lo - pad
+    width = np.maximum((hi + pad - lo) / n_bins, 1e-12)
+    return lo, width
+
+def _percentiles(counts, lo, width, percentiles):
+    # Linear interpolation inside the bin that crosses each percentile
+    total = counts.sum(axis=1, keepdims=True)
+    cdf = np.cumsum(counts, axis=1)
+    rows = np.arange(counts.shape[0])
+    bands = {}
+    for q in percentiles:
+        target = q / 100.0 * total[:, 0]
+        idx = np.argmax(cdf >= target[:, None], axis=1)
+        below = np.where(idx > 0, cdf[rows, np.maximum(idx - 1, 0)], 0)
+        in_bin = np.maximum(counts[rows, idx], 1)
+        frac = np.clip((target - below) / in_bin, 0.0, 1.0)
+        bands[q] = lo + (idx + frac) * width
+    return bands
+
+def run_monte_carlo(filename='lab9-dataset/ACCELERATION.csv', n_realisations=100_000,
+                    noise_std=None, bias_std=0.05, drift_std=0.005, chunk_size=10_000,
+                    workers=1, n_bins=2048, percentiles=PERCENTILES, seed=0):
+    # noise_std defaults to the noise level of the recorded noisy signal;
+    # bias_std (m/s²) and drift_std (m/s³) are per-realisation spreads
+    timestamps, acceleration, measured_noise_std = load_profile(filename)
+    if noise_std is None:
+        noise_std = measured_noise_std
+    dt = timestamps[1] - timestamps[0]
+    clean_velocity, clean_distance = integrate(acceleration, dt)
+
+    # Pilot draw fixes the histogram ranges before the main run
+    seeds = np.random.SeedSequence(seed).spawn(1 + -(-n_realisations // chunk_size))
+    pilot = draw_realisations(np.random.default_rng(seeds[0]), min(chunk_size, 2000),
+                              timestamps, acceleration, noise_std, bias_std, drift_std)
+    pilot_velocity, pilot_distance = integrate(pilot, dt)
+    ranges = {'velocity': _bin_ranges(pilot_velocity - clean_velocity, n_bins),
+              'distance': _bin_ranges(pilot_distance - clean_distance, n_bins)}
+
+    tasks = []
+    remaining = n_realisations
+    for chunk_seed in seeds[1:]:
+        n = min(chunk_size, remaining)
+        remaining -= n
+        tasks.append((chunk_seed, n, timestamps, acceleration, clean_velocity, clean_distance,
+                      noise_std, bias_std, drift_std, ranges, n_bins))
+
+    # Fold each chunk into running totals as it arrives, so only one chunk's
+    # histograms are held at a time whatever the number of realisations
+    totals = {name: {'counts': 0, 'sum': 0.0, 'sumsq': 0.0, 'clipped': 0}
+              for name in ('velocity', 'distance')}
+
+    def accumulate(chunks):
+        for chunk in chunks:
+            for name, total in totals.items():
+                for field in total:
+                    total[field] = total[field] + chunk[name][field]
+
+    if workers > 1:
+        with Pool(workers) as pool:
+            accumulate(pool.imap_unordered(_run_chunk, tasks))
+    else:
+        accumulate(_run_chunk(task) for task in tasks)
+
+    result = {'timestamps': timestamps, 'n_realisations': n_realisations, 'noise_std': noise_std,
+              'clean_velocity': clean_velocity, 'clean_distance': clean_distance}
+    for name, total in totals.items():
+        mean = total['sum'] / n_realisations
+        meansq = total['sumsq'] / n_realisations
+        result[name] = {
+            'bands': _percentiles(total['counts'], *ranges[name], percentiles),
+            'mean': mean,
+            'std': np.sqrt(np.maximum(meansq - mean**2, 0.0)),
+            'clipped': total['clipped'],
+        }
+    return result
+
+def plot_error_bands(result):
+    plt = pyplot()
+
+    timestamps = result['timestamps']
+    fig, axes = plt.subplots(2, 1, figsize=(10, 8))
+    for ax, name, unit in ((axes[0], 'velocity', 'm/s'), (axes[1], 'distance', 'm')):
+        bands = result[name]['bands']
+        ax.fill_between(timestamps, bands[5], bands[95], alpha=0.2, label='5-95th percentile')
+        ax.fill_between(timestamps, bands[25], bands[75], alpha=0.4, label='25-75th percentile')
+        ax.plot(timestamps, bands[50], linewidth=2, label='Median')
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel(f'{name.capitalize()} Error ({unit})')
+        ax.set_title(f'{name.capitalize()} Error ({result["n_realisations"]} realisations)')
+        ax.legend()
+        ax.grid(True)
+
+    plt.tight_layout()
+    plt.savefig('plot7_error_bands.png', dpi=300)
+    plt.close()
+
+def main(filename='lab9-dataset/ACCELERATION.csv', n_realisations=100_000, workers=None, plots=True):
+    print("Monte Carlo Error Propagation")
+    print("-" * 50)
+
+    result = run_monte_carlo(filename, n_realisations, workers=workers or os.cpu_count() or 1)
+    final_distance = result['clean_distance'][-1]
+    bands = result['distance']['bands']
+
+    print(f"Realisations: {n_realisations}, white noise std: {result['noise_std']:.4f} m/s²")
+    print(f"Final distance using actual acceleration: {final_distance:.4f} m")
+    for q in PERCENTILES:
+        print(f"  {q:>2}th percentile distance error: {bands[q][-1]:+.4f} m "
+              f"({bands[q][-1] / final_distance * 100:+.2f}%)")
+    if result['distance']['clipped']:
+        print(f"  ({result['distance']['clipped']} samples fell outside the histogram range)")
+
+    if plots:
+        plot_error_bands(result)
+        print("Error band plot saved to plot7_error_bands.png")
+
+if __name__ == "__main__":
+    main()
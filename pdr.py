@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Unified entry point for the lab analyses: python pdr.py <command> [options]
+# Only the standard library is imported at module level. numpy, pandas and
+# scipy load when a command first needs them, and matplotlib only when a
+# plot is drawn, so --no-plots runs never import it.
+
+DATASET_DIR = 'lab9-dataset'
+
+def run_accel(args):
+    import analyze_acceleration
+    analyze_acceleration.main(args.file or os.path.join(DATASET_DIR, 'ACCELERATION.csv'), plots=args.plots)
+
+def run_steps(args):
+    import step_detection
+    step_detection.main(args.file or os.path.join(DATASET_DIR, 'WALKING.csv'), plots=args.plots)
+
+def run_turns(args):
+    import turn_detection
+    turn_detection.main(args.file or os.path.join(DATASET_DIR, 'TURNING.csv'), plots=args.plots)
+
+def run_trajectory(args):
+    import trajectory_plot
+    trajectory_plot.main(args.file or os.path.join(DATASET_DIR, 'WALKING_AND_TURNING.csv'), plots=args.plots,
+                         heading=args.heading, shared_workers=args.shared_workers)
+
+def run_montecarlo(args):
+    import monte_carlo
+    monte_carlo.main(args.file or os.path.join(DATASET_DIR, 'ACCELERATION.csv'),
+                     n_realisations=args.realisations, workers=args.workers, plots=args.plots)
+
+def run_report(args):
+    import analyze_acceleration
+    import step_detection
+    import turn_detection
+    import trajectory_plot
+    import generate_report
+
+    # The report embeds every plot, so always regenerate them first
+    analyze_acceleration.main()
+    step_detection.main()
+    turn_detection.main()
+    trajectory_plot.main()
+    generate_report.create_report()
+
+def run_batch(args):
+    files = []
+    for pattern in args.files or [os.path.join(DATASET_DIR, '*.csv')]:
+        files.extend(sorted(glob.glob(pattern)))
+
+    # Skip recordings without IMU columns (e.g. ACCELERATION.csv)
+    imu_files = []
+    for filename in files:
+        with open(filename) as f:
+            header = f.readline()
+        if 'gyro_z' in header:
+            imu_files.append(filename)
+
+    from prefetch_loader import PrefetchLoader
+
+    # Recordings are read and decoded ahead of the compute stage
+    loader = PrefetchLoader(imu_files, lookahead=args.lookahead)
+
+    print(f"{'file':<32} {'rate (Hz)':>10} {'steps':>6} {'turns':>6}")
+    if args.batched:
+        run_batch_stacked(loader, args.batch_size)
+    else:
+        import step_detection
+        import turn_detection
+
+        # detect_steps and detect_turns reuse the prefetched recording from the stage cache
+        for filename, _ in loader:
+            _, _, _, _, _, num_steps, fs = step_detection.detect_steps(filename)
+            turns = turn_detection.detect_turns(filename)[4]
+            print(f"{os.path.basename(filename):<32} {fs:>10.2f} {num_steps:>6} {len(turns):>6}")
+
+    stats = loader.stats()
+    print(f"I/O wait: {stats['io_wait_seconds']:.3f} s, compute: {stats['compute_seconds']:.3f} s "
+          f"({stats['io_wait_fraction']:.0%} waiting, look-ahead {stats['lookahead']})")
+
+    if args.index:
+        index_sessions(imu_files, args.index)
+
+def index_sessions(filenames, path):
+    import trajectory_plot
+    from spatial_index import StepIndex, trajectory_steps
+
+    # Sessions are named by absolute path; ones already in the index are skipped
+    index = StepIndex.open(path)
+    sessions = []
+    for filename in filenames:
+        name = os.path.abspath(filename)
+        if name in index.sessions:
+            continue
+        timestamps, step_indices, cumulative_angle_deg, _ = trajectory_plot.detect_steps_and_turns(filename)
+        sessions.append((name,) + trajectory_steps(timestamps, step_indices, cumulative_angle_deg))
+
+    index.add_sessions(sessions)
+    index.save(path)
+    print(f"Indexed {len(sessions)} new sessions, {len(index)} steps in {path}")
+
+def run_query(args):
+    from spatial_index import StepIndex
+
+    index = StepIndex.load(args.index)
+    if args.near:
+        x, y, radius = args.near
+        steps = index.within_radius(x, y, radius)
+        print(f"{len(steps['x'])} steps within {radius} m of ({x}, {y})")
+        for session, t, sx, sy, heading in zip(steps['session'], steps['time'], steps['x'],
+                                               steps['y'], steps['heading']):
+            print(f"  {os.path.basename(index.sessions[session])}: t = {t:.2f}s, "
+                  f"({sx:.2f}, {sy:.2f}), heading = {heading:.1f}°")
+    if args.box:
+        sessions = index.sessions_in_box(*args.box)
+        print(f"{len(sessions)} sessions pass through box {tuple(args.box)}")
+        for session in sessions:
+            print(f"  {session}")
+
+def run_batch_stacked(loader, batch_size):
+    import numpy as np
+
+    import batch_kernels
+
+    def process(group):
+        result = batch_kernels.process_batch(group)
+        step_counts = np.diff(result['step_offsets'])
+        turn_counts = np.diff(result['turn_offsets'])
+        for filename, num_steps, num_turns in zip(group, step_counts, turn_counts):
+            print(f"{os.path.basename(filename):<32} {result['sampling_rate']:>10.2f} {num_steps:>6} {num_turns:>6}")
+
+    # Recordings of equal length and sampling rate are stacked and processed
+    # together. A group is processed as soon as it is full, while the loader
+    # keeps reading ahead; partly filled groups are processed at the end.
+    groups = {}
+    for filename, recording in loader:
+        timestamps = recording['timestamp']
+        key = (len(timestamps), batch_kernels.rate_bucket(timestamps))
+        group = groups.setdefault(key, [])
+        group.append(filename)
+        if len(group) >= batch_size:
+            process(groups.pop(key))
+
+    # The loader only times compute between the recordings it hands out, so
+    # count the final groups here
+    start = time.perf_counter()
+    for group in groups.values():
+        process(group)
+    loader.compute_time += time.perf_counter() - start
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pdr', description='Pedestrian dead reckoning analyses')
+    parser.add_argument('--cache-stats', action='store_true', help='print stage cache statistics on exit')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    commands = [
+        ('accel', run_accel, 'Part 1: acceleration error analysis'),
+        ('steps', run_steps, 'Part 2: step detection'),
+        ('turns', run_turns, 'Part 3: turn detection'),
+        ('trajectory', run_trajectory, 'Part 4: trajectory plotting'),
+    ]
+    for name, handler, description in commands:
+        sub = subparsers.add_parser(name, help=description)
+        sub.add_argument('--file', help='recording to analyse (defaults to the lab dataset)')
+        sub.add_argument('--no-plots', dest='plots', action='store_false', help='print results only')
+        sub.set_defaults(handler=handler)
+        if name == 'trajectory':
+            sub.add_argument('--heading', choices=['gyro_z', 'orientation'], default='gyro_z',
+                             help='integrate gyro_z (phone held flat) or use the 3-D orientation filter '
+                                  '(needs numba for full speed)')
+            sub.add_argument('--shared-workers', type=int,
+                             help='process the recording in this many worker processes over shared memory '
+                                  '(for very long recordings; gyro_z heading only)')
+
+    sub = subparsers.add_parser('montecarlo', help='error bands for double integration under sensor noise')
+    sub.add_argument('--file', help='clean acceleration profile (defaults to ACCELERATION.csv)')
+    sub.add_argument('--realisations', type=int, default=100_000, help='number of noise realisations')
+    sub.add_argument('--workers', type=int, help='worker processes (defaults to the CPU count)')
+    sub.add_argument('--no-plots', dest='plots', action='store_false', help='print results only')
+    sub.set_defaults(handler=run_montecarlo)
+
+    sub = subparsers.add_parser('report', help='run every analysis and build report.pdf')
+    sub.set_defaults(handler=run_report)
+
+    sub = subparsers.add_parser('batch', help='step and turn counts for many recordings (no plots)')
+    sub.add_argument('files', nargs='*', help='files or glob patterns (defaults to lab9-dataset/*.csv)')
+    sub.add_argument('--lookahead', type=int, default=2,
+                     help='recordings to read and decode ahead of the compute stage')
+    sub.add_argument('--batched', action='store_true',
+                     help='stack equal-length recordings and process them with batch_kernels')
+    sub.add_argument('--batch-size', type=int, default=64,
+                     help='with --batched, recordings stacked per kernel call')
+    sub.add_argument('--index', help='add step positions to this spatial index file (.npz)')
+    sub.set_defaults(handler=run_batch)
+
+    sub = subparsers.add_parser('query', help='query a spatial index of step positions')
+    sub.add_argument('index', help='index file written by batch --index')
+    sub.add_argument('--near', nargs=3, type=float, metavar=('X', 'Y', 'R'),
+                     help='steps within R metres of (X, Y)')
+    sub.add_argument('--box', nargs=4, type=float, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                     help='sessions with a step inside the box')
+    sub.set_defaults(handler=run_query)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+    if args.cache_stats:
+        from stage_cache import cache_stats
+        print(f"Stage cache: {cache_stats()}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+def pyplot():
+    # Import matplotlib only when a plot is actually drawn, selecting the
+    # non-interactive backend before pyplot is loaded
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
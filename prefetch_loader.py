@@ -0,0 +1,61 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from stages import load_recording
+
+# Prefetching loader for batch runs. Upcoming recordings are read and decoded
+# on a background thread pool while the caller computes on the current one.
+# At most `lookahead` recordings are in flight or waiting, so memory stays
+# bounded; the time the caller spends blocked on a recording that is not
+# ready yet is reported as I/O wait.
+
+class PrefetchLoader:
+    def __init__(self, filenames, lookahead=2, workers=None, decode=load_recording):
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1")
+        self.filenames = list(filenames)
+        self.lookahead = lookahead
+        self.workers = workers or lookahead
+        self.decode = decode
+
+        self.io_wait = 0.0
+        self.compute_time = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        pending = deque()  # bounded queue of (filename, future), oldest first
+        upcoming = iter(self.filenames)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch') as pool:
+            def fill():
+                while len(pending) < self.lookahead:
+                    filename = next(upcoming, None)
+                    if filename is None:
+                        return
+                    pending.append((filename, pool.submit(self.decode, filename)))
+
+            fill()
+            while pending:
+                filename, future = pending.popleft()
+                # Keep the pool busy with the next file before blocking on this one
+                fill()
+
+                start = time.perf_counter()
+                recording = future.result()
+                self.io_wait += time.perf_counter() - start
+
+                start = time.perf_counter()
+                yield filename, recording
+                self.compute_time += time.perf_counter() - start
+                self.items += 1
+
+    def stats(self):
+        total = self.io_wait + self.compute_time
+        return {
+            'items': self.items,
+            'lookahead': self.lookahead,
+            'io_wait_seconds': self.io_wait,
+            'compute_seconds': self.compute_time,
+            'io_wait_fraction': self.io_wait / total if total else 0.0,
+        }
@@ -0,0 +1,209 @@
+import os
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from stages import lowpass_filter
+
+# Parallel processing of one large recording without copying it into workers.
+# The decoded channels live in a shared input block and every result row in a
+# shared output block; worker processes attach to both by name and receive
+# only row numbers and sample ranges, so no large array is ever pickled.
+# SharedRecording.from_csv decodes the CSV in chunks straight into the input
+# block, bypassing the stage cache, so the recording is held in memory once.
+# With one worker the same tasks run in-process on the parent's views.
+#
+#   1. magnitude        time chunks, in place
+#   2. low-pass filters one task per channel (filtfilt needs the whole row)
+#   3. heading          time chunks integrate locally, then add the running
+#                       total of the preceding chunks
+
+INPUT_ROWS = ['timestamp', 'accel_x', 'accel_y', 'accel_z', 'gyro_z']
+OUTPUT_ROWS = ['accel_mag', 'filtered_accel_mag', 'filtered_gyro_z', 'heading_deg']
+
+# Set in each worker by _attach
+_input = None
+_output = None
+_blocks = []
+
+def _open_block(name):
+    # Workers only attach; the parent owns the block and unlinks it. Before
+    # Python 3.13 attaching also registers the block with the resource
+    # tracker, which workers share with the parent, so the registration is
+    # left in place for the parent's unlink() to remove.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _attach(input_name, output_name, n_samples):
+    global _input, _output
+    for name, rows in ((input_name, INPUT_ROWS), (output_name, OUTPUT_ROWS)):
+        block = _open_block(name)
+        _blocks.append(block)
+        view = np.ndarray((len(rows), n_samples), dtype=np.float64, buffer=block.buf)
+        if rows is INPUT_ROWS:
+            _input = view
+        else:
+            _output = view
+
+def _row(name):
+    if name in INPUT_ROWS:
+        return _input[INPUT_ROWS.index(name)]
+    return _output[OUTPUT_ROWS.index(name)]
+
+def _magnitude_chunk(bounds):
+    a, b = bounds
+    x, y, z = (_row(name)[a:b] for name in ('accel_x', 'accel_y', 'accel_z'))
+    out = _row('accel_mag')[a:b]
+    np.multiply(x, x, out=out)
+    out += y * y
+    out += z * z
+    np.sqrt(out, out=out)
+
+def _filter_channel(task):
+    source, target, cutoff_freq, sampling_rate = task
+    _row(target)[:] = lowpass_filter(_row(source), cutoff_freq, sampling_rate)
+
+def _integrate_chunk(bounds):
+    # heading[i] = sum of gyro[k] * dt[k] for k < i, local to this chunk
+    a, b = bounds
+    timestamps = _row('timestamp')
+    gyro = _row('filtered_gyro_z')
+    out = _row('heading_deg')[a:b]
+
+    lo = max(a, 1)
+    out[:lo - a] = 0.0
+    np.subtract(timestamps[lo:b], timestamps[lo - 1:b - 1], out=out[lo - a:])
+    out[lo - a:] *= gyro[lo - 1:b - 1] / 1e9
+    np.cumsum(out, out=out)
+    return float(out[-1]) if b > a else 0.0
+
+def _offset_chunk(task):
+    (a, b), carry = task
+    out = _row('heading_deg')[a:b]
+    out += carry
+    np.degrees(out, out=out)
+
+def _run_stages(map_fn, chunks, fs, step_cutoff, turn_cutoff):
+    map_fn(_magnitude_chunk, chunks)
+
+    filters = [('accel_mag', 'filtered_accel_mag', step_cutoff, fs),
+               ('gyro_z', 'filtered_gyro_z', turn_cutoff, fs)]
+    map_fn(_filter_channel, filters)
+
+    totals = map_fn(_integrate_chunk, chunks)
+    carries = np.concatenate([[0.0], np.cumsum(totals[:-1])])
+    map_fn(_offset_chunk, list(zip(chunks, carries)))
+
+class SharedRecording:
+    # Usage:
+    #   with SharedRecording.from_csv(filename) as shared:
+    #       shared.process(workers=8)
+    #       heading = shared['heading_deg']  # view, valid inside the block
+    def __init__(self, n_samples):
+        # Allocates the blocks; fill self.inputs, or use from_csv/from_recording
+        self.n_samples = n_samples
+        self.inputs = self.outputs = None
+        self._blocks = []
+        try:
+            # Release whatever was already created if a later block fails
+            self._input_block = self._create_block(len(INPUT_ROWS) * n_samples)
+            self._output_block = self._create_block(len(OUTPUT_ROWS) * n_samples)
+            self.inputs = np.ndarray((len(INPUT_ROWS), n_samples), dtype=np.float64, buffer=self._input_block.buf)
+            self.outputs = np.ndarray((len(OUTPUT_ROWS), n_samples), dtype=np.float64, buffer=self._output_block.buf)
+        except BaseException:
+            self.close()
+            raise
+
+    @classmethod
+    def from_recording(cls, recording):
+        shared = cls(len(recording['timestamp']))
+        try:
+            for i, name in enumerate(INPUT_ROWS):
+                shared.inputs[i] = recording[name]
+        except BaseException:
+            shared.close()
+            raise
+        return shared
+
+    @classmethod
+    def from_csv(cls, filename, chunk_rows=1_000_000):
+        import pandas as pd
+
+        # Count rows first so the blocks can be sized, then decode chunk by
+        # chunk into them; same parsing options as stages.load_recording
+        with open(filename, 'rb') as f:
+            n_samples = sum(1 for line in f if line.strip()) - 1
+        shared = cls(n_samples)
+        try:
+            start = 0
+            for chunk in pd.read_csv(filename, usecols=lambda c: c in INPUT_ROWS, index_col=False,
+                                     chunksize=chunk_rows):
+                stop = start + len(chunk)
+                for i, name in enumerate(INPUT_ROWS):
+                    shared.inputs[i, start:stop] = chunk[name].values
+                start = stop
+            if start != n_samples:
+                raise ValueError(f"{filename}: expected {n_samples} rows, read {start}")
+        except BaseException:
+            shared.close()
+            raise
+        return shared
+
+    def _create_block(self, n_values):
+        block = shared_memory.SharedMemory(create=True, size=8 * n_values)
+        self._blocks.append(block)
+        return block
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getitem__(self, name):
+        if name in INPUT_ROWS:
+            return self.inputs[INPUT_ROWS.index(name)]
+        return self.outputs[OUTPUT_ROWS.index(name)]
+
+    def close(self):
+        self.inputs = self.outputs = None
+        while self._blocks:
+            block = self._blocks.pop()
+            block.close()
+            block.unlink()
+
+    def sampling_rate(self):
+        dt = np.mean(np.diff(self['timestamp'])) / 1e9
+        return 1.0 / dt
+
+    def process(self, workers=None, chunk_size=None, step_cutoff=3.0, turn_cutoff=1.0):
+        workers = workers or os.cpu_count() or 1
+        n = self.n_samples
+        chunk_size = chunk_size or max(1, -(-n // workers))
+        chunks = [(a, min(a + chunk_size, n)) for a in range(0, n, chunk_size)]
+        fs = self.sampling_rate()
+
+        if workers == 1:
+            # Starting a pool only adds overhead for a single worker
+            global _input, _output
+            _input, _output = self.inputs, self.outputs
+            try:
+                _run_stages(lambda fn, tasks: list(map(fn, tasks)), chunks, fs, step_cutoff, turn_cutoff)
+            finally:
+                _input = _output = None
+            return
+
+        initargs = (self._input_block.name, self._output_block.name, n)
+        with Pool(workers, initializer=_attach, initargs=initargs) as pool:
+            _run_stages(pool.map, chunks, fs, step_cutoff, turn_cutoff)
+
+def process_recording_shared(filename, workers=None, chunk_size=None, step_cutoff=3.0, turn_cutoff=1.0):
+    # Convenience wrapper returning private copies of the timestamps, every
+    # output row and the sampling rate
+    with SharedRecording.from_csv(filename) as shared:
+        shared.process(workers, chunk_size, step_cutoff, turn_cutoff)
+        channels = {name: np.array(shared[name]) for name in ['timestamp'] + OUTPUT_ROWS}
+        channels['sampling_rate'] = shared.sampling_rate()
+        return channels
@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+
+# Persistent uniform-grid index over step positions from many sessions.
+# Steps are stored column-wise (x, y, session, time, heading) and sorted by a
+# 64-bit cell key with the cell row in the high bits, so every row of cells a
+# query touches is one contiguous range found with two binary searches. New
+# sessions go to a smaller pending segment, kept sorted the same way and
+# searched alongside the main one, that is merged into the main segment once
+# it grows past a fraction of it. Inserting a batch only re-sorts the pending
+# segment, and no query ever scans steps outside the cells it touches.
+
+_CELL_OFFSET = 1 << 30
+_COLUMNS = {'x': np.float64, 'y': np.float64, 'session': np.int32,
+            'time': np.float64, 'heading': np.float32}
+
+def _empty():
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in _COLUMNS.items()}
+
+def _concat(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in _COLUMNS}
+
+def trajectory_steps(timestamps, step_indices, cumulative_angle_deg, start_angle=90.0, step_length=1.0):
+    # Step positions as in create_trajectory, without the starting point
+    heading = start_angle + np.asarray(cumulative_angle_deg)[step_indices]
+    x = np.cumsum(step_length * np.cos(np.radians(heading)))
+    y = np.cumsum(step_length * np.sin(np.radians(heading)))
+    time = (np.asarray(timestamps)[step_indices] - timestamps[0]) / 1e9
+    return x, y, time, heading
+
+class StepIndex:
+    def __init__(self, cell_size=1.0, merge_fraction=0.1):
+        self.cell_size = cell_size
+        self.merge_fraction = merge_fraction
+        self.sessions = []  # session id -> name
+        self._sorted = _empty()
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._pending = _empty()
+        self._pending_keys = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._keys) + len(self._pending_keys)
+
+    def _cells(self, x, y):
+        cx = np.floor(np.asarray(x) / self.cell_size).astype(np.int64) + _CELL_OFFSET
+        cy = np.floor(np.asarray(y) / self.cell_size).astype(np.int64) + _CELL_OFFSET
+        return cx, cy
+
+    def _key(self, x, y):
+        cx, cy = self._cells(x, y)
+        return (cy << 31) | cx
+
+    def add_session(self, name, x, y, time, heading):
+        self.add_sessions([(name, x, y, time, heading)])
+
+    def add_sessions(self, sessions):
+        # sessions: iterable of (name, x, y, time, heading)
+        sessions = list(sessions)
+        names = [session[0] for session in sessions]
+        for name in names:
+            if name in self.sessions or names.count(name) > 1:
+                raise ValueError(f"session {name!r} is already indexed")
+
+        parts = [self._pending]
+        for name, x, y, time, heading in sessions:
+            session_id = len(self.sessions)
+            self.sessions.append(name)
+            part = {'x': x, 'y': y, 'session': np.full(len(x), session_id), 'time': time, 'heading': heading}
+            parts.append({column: np.asarray(part[column], dtype=dtype)
+                          for column, dtype in _COLUMNS.items()})
+
+        self._pending_keys, self._pending = self._sort(_concat(parts))
+        if len(self._pending_keys) > self.merge_fraction * len(self._keys):
+            self.merge()
+
+    def _sort(self, columns):
+        keys = self._key(columns['x'], columns['y'])
+        order = np.argsort(keys, kind='stable')
+        return keys[order], {name: values[order] for name, values in columns.items()}
+
+    def merge(self):
+        # Fold the pending segment into the main sorted arrays
+        if len(self._pending_keys) == 0:
+            return
+        self._keys, self._sorted = self._sort(_concat([self._sorted, self._pending]))
+        self._pending_keys, self._pending = np.zeros(0, dtype=np.int64), _empty()
+
+    def _box_candidates(self, keys, xmin, ymin, xmax, ymax):
+        # Indices into a sorted segment for every cell overlapping the box
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        (cx0, cx1), (cy0, cy1) = self._cells([xmin, xmax], [ymin, ymax])
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) << 31
+        starts = np.searchsorted(keys, rows | cx0, side='left')
+        stops = np.searchsorted(keys, rows | cx1, side='right')
+        lengths = stops - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Concatenated ranges starts[i]:stops[i] without a Python loop
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return offsets + np.arange(total)
+
+    def _select(self, mask_fn, xmin, ymin, xmax, ymax):
+        parts = [_empty()]
+        for keys, columns in ((self._keys, self._sorted), (self._pending_keys, self._pending)):
+            candidates = self._box_candidates(keys, xmin, ymin, xmax, ymax)
+            if len(candidates):
+                chosen = candidates[mask_fn(columns['x'][candidates], columns['y'][candidates])]
+                parts.append({name: values[chosen] for name, values in columns.items()})
+        return _concat(parts)
+
+    def within_radius(self, x, y, radius):
+        # All steps within radius metres of (x, y), as a dict of columns
+        def mask(px, py):
+            return (px - x)**2 + (py - y)**2 <= radius**2
+        return self._select(mask, x - radius, y - radius, x + radius, y + radius)
+
+    def in_box(self, xmin, ymin, xmax, ymax):
+        def mask(px, py):
+            return (px >= xmin) & (px <= xmax) & (py >= ymin) & (py <= ymax)
+        return self._select(mask, xmin, ymin, xmax, ymax)
+
+    def sessions_in_box(self, xmin, ymin, xmax, ymax):
+        # Names of the sessions with at least one step inside the box
+        ids = np.unique(self.in_box(xmin, ymin, xmax, ymax)['session'])
+        return [self.sessions[i] for i in ids]
+
+    def save(self, path):
+        self.merge()
+        meta = {'cell_size': self.cell_size, 'merge_fraction': self.merge_fraction, 'sessions': self.sessions}
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=self._keys, meta=np.array(json.dumps(meta)), **self._sorted)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            index = cls(meta['cell_size'], meta['merge_fraction'])
+            index.sessions = meta['sessions']
+            index._keys = data['keys']
+            index._sorted = {name: data[name] for name in _COLUMNS}
+        return index
+
+    @classmethod
+    def open(cls, path, cell_size=1.0):
+        # Load an existing index or start an empty one
+        if os.path.exists(path):
+            return cls.load(path)
+        return cls(cell_size)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'PDR_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.stage_cache'))
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+
+_hash_lock = threading.Lock()
+_file_hashes = {}
+
+def content_hash(path):
+    # SHA-256 of the file contents, remembered per (path, size, mtime) so a
+    # recording is only read for hashing once per process
+    st = os.stat(path)
+    stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if stamp in _file_hashes:
+            return _file_hashes[stamp]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    value = digest.hexdigest()
+
+    with _hash_lock:
+        _file_hashes[stamp] = value
+    return value
+
+_code_versions = {}
+
+def code_version(compute):
+    # Derived from the source of the module that defines the stage, so any
+    # edit to a stage or the helpers next to it invalidates its entries;
+    # falls back to the compiled bytecode and constants when there is no file
+    code = compute.__code__
+    with _hash_lock:
+        if code.co_filename in _code_versions:
+            return _code_versions[code.co_filename]
+    try:
+        with open(code.co_filename, 'rb') as f:
+            value = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return hashlib.sha256(code.co_code + repr(code.co_consts).encode('utf-8')).hexdigest()
+    with _hash_lock:
+        _code_versions[code.co_filename] = value
+    return value
+
+def _nbytes(value):
+    # Approximate in-memory footprint of a stage result
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+def _freeze(value):
+    # Results are shared by every consumer, so make array outputs read-only
+    if hasattr(value, 'setflags'):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _freeze(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _freeze(v)
+    return value
+
+class StageCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_memory_bytes=DEFAULT_MEMORY_BYTES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        # cache_dir=None keeps the cache in memory only
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()  # key -> (value, nbytes), oldest first
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'memory_evictions': 0, 'disk_evictions': 0}
+
+    @staticmethod
+    def make_key(input_hash, stage, params, version):
+        # Parameters are serialised with sorted keys so argument order never matters
+        payload = json.dumps([input_hash, stage, params or {}, version],
+                             sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, input_hash, stage, params, compute, version=None):
+        # version defaults to code_version(compute)
+        key = self.make_key(input_hash, stage, params, version or code_version(compute))
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._memory[key][0]
+
+        value = self._disk_get(key)
+        if value is not None:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+            self._memory_put(key, _freeze(value))
+            return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        value = _freeze(compute())
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for path, _, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _memory_put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (value, size)
+            self._memory_bytes += size
+            # Evict least recently used entries until we fit the budget
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted
+                self._stats['memory_evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def _disk_get(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        # Touch the entry so disk eviction follows last use, not creation
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _disk_put(self, key, value):
+        if not self.cache_dir:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._disk_path(key))
+        except Exception:
+            # Any failure (disk full, unpicklable value) only costs a later miss
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        self._evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime_ns, st.st_size))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats['disk_evictions'] += 1
+
+_default_cache = None
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = StageCache()
+    return _default_cache
+
+def set_default_cache(cache):
+    global _default_cache
+    _default_cache = cache
+
+def cached_stage(stage, filename, params, compute, version=None, cache=None):
+    # Memoize one stage of the pipeline for the recording stored in filename
+    cache = cache or default_cache()
+    return cache.get_or_compute(content_hash(filename), stage, params, compute, version)
+
+def cache_stats():
+    return default_cache().stats()
@@ -0,0 +1,96 @@
+import numpy as np
+
+from stage_cache import cached_stage
+
+# Shared processing stages for step, turn and trajectory analysis.
+# Every stage is memoized on the recording contents, so the magnitude,
+# filters, peak search and heading integration run once per recording
+# no matter how many analyses consume them. pandas and scipy are imported
+# inside the stages that need them, so cache hits never load them.
+
+SENSOR_COLUMNS = ['timestamp', 'accel_x', 'accel_y', 'accel_z',
+                  'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z']
+
+def lowpass_filter(data, cutoff_freq, sampling_rate, order=4):
+    from scipy.signal import butter, filtfilt
+
+    # Butterworth low-pass filter
+    nyquist = 0.5 * sampling_rate
+    normal_cutoff = cutoff_freq / nyquist
+    b, a = butter(order, normal_cutoff, btype='low', analog=False)
+    filtered_data = filtfilt(b, a, data)
+    return filtered_data
+
+def load_recording(filename):
+    # index_col=False stops pandas from treating the first column as the index
+    # when rows end with a trailing comma (WALKING_AND_TURNING.csv), and
+    # usecols tolerates rows with fewer or extra fields (TURNING.csv)
+    def compute():
+        import pandas as pd
+
+        df = pd.read_csv(filename, usecols=lambda c: c in SENSOR_COLUMNS, index_col=False)
+        recording = {}
+        for column in SENSOR_COLUMNS:
+            if column == 'timestamp':
+                recording[column] = df[column].values
+            elif column in df:
+                recording[column] = df[column].values.astype(np.float64)
+        return recording
+
+    return cached_stage('load', filename, None, compute)
+
+def sampling_rate(filename):
+    timestamps = load_recording(filename)['timestamp']
+    dt = np.mean(np.diff(timestamps)) / 1e9  # Convert nanoseconds to seconds
+    return 1.0 / dt
+
+def accel_magnitude(filename):
+    def compute():
+        recording = load_recording(filename)
+        return np.sqrt(recording['accel_x']**2 + recording['accel_y']**2 + recording['accel_z']**2)
+
+    return cached_stage('accel_magnitude', filename, None, compute)
+
+def filtered_channel(filename, channel, cutoff_freq, order=4):
+    # channel is a column name or 'accel_mag'
+    def compute():
+        if channel == 'accel_mag':
+            data = accel_magnitude(filename)
+        else:
+            data = load_recording(filename)[channel]
+        return lowpass_filter(data, cutoff_freq, sampling_rate(filename), order)
+
+    params = {'channel': channel, 'cutoff_freq': cutoff_freq, 'order': order}
+    return cached_stage('lowpass', filename, params, compute)
+
+def find_steps(filtered_accel, sampling_rate, height_std=0.5, min_step_interval=0.3):
+    from scipy.signal import find_peaks
+
+    # Parameters tuned to detect walking steps
+    min_peak_height = np.mean(filtered_accel) + height_std * np.std(filtered_accel)
+    min_distance = int(min_step_interval * sampling_rate)
+
+    peaks, _ = find_peaks(filtered_accel, height=min_peak_height, distance=min_distance)
+    return peaks
+
+def step_peaks(filename, cutoff_freq=3.0, height_std=0.5, min_step_interval=0.3):
+    def compute():
+        filtered_accel = filtered_channel(filename, 'accel_mag', cutoff_freq)
+        return find_steps(filtered_accel, sampling_rate(filename), height_std, min_step_interval)
+
+    params = {'cutoff_freq': cutoff_freq, 'height_std': height_std,
+              'min_step_interval': min_step_interval}
+    return cached_stage('step_peaks', filename, params, compute)
+
+def cumulative_heading(filename, cutoff_freq=1.0):
+    # Integrated filtered gyro_z in degrees; angle[i] = sum of gyro[k] * dt[k] for k < i
+    def compute():
+        timestamps = load_recording(filename)['timestamp']
+        filtered_gyro_z = filtered_channel(filename, 'gyro_z', cutoff_freq)
+        dt = np.diff(timestamps) / 1e9
+
+        cumulative_angle = np.zeros(len(timestamps))
+        np.cumsum(filtered_gyro_z[:-1] * dt, out=cumulative_angle[1:])
+        return np.degrees(cumulative_angle)
+
+    return cached_stage('cumulative_heading', filename, {'cutoff_freq': cutoff_freq}, compute)
@@ -1,38 +1,25 @@
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
-from scipy.signal import butter, filtfilt
-from scipy.signal import find_peaks
+
+from plotting import pyplot
+
+from stages import load_recording, sampling_rate, accel_magnitude, filtered_channel, step_peaks
 
 def moving_average(data, window_size):
     # Simple moving average filter
     return np.convolve(data, np.ones(window_size)/window_size, mode='same')
 
-def lowpass_filter(data, cutoff_freq, sampling_rate, order=4):
-    # Butterworth low-pass filter
-    nyquist = 0.5 * sampling_rate
-    normal_cutoff = cutoff_freq / nyquist
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    filtered_data = filtfilt(b, a, data)
-    return filtered_data
-
 def detect_steps(filename):
-    # Read data
-    df = pd.read_csv(filename)
-
-    timestamps = df['timestamp'].values
-    accel_x = df['accel_x'].values
-    accel_y = df['accel_y'].values
-    accel_z = df['accel_z'].values
+    # Read data and shared stages (memoized, see stages.py)
+    recording = load_recording(filename)
+    timestamps = recording['timestamp']
 
     # Calculate acceleration magnitude
-    accel_mag = np.sqrt(accel_x**2 + accel_y**2 + accel_z**2)
+    accel_mag = accel_magnitude(filename)
 
     # Calculate sampling rate
-    dt = np.mean(np.diff(timestamps)) / 1e9  # Convert nanoseconds to seconds
-    sampling_rate = 1.0 / dt
+    fs = sampling_rate(filename)
 
     # Apply smoothing - using moving average
     window_size = 10
@@ -40,20 +27,21 @@ def detect_steps(filename):
 
     # Also try low-pass filter
     cutoff_freq = 3.0  # Hz
-    filtered_accel = lowpass_filter(accel_mag, cutoff_freq, sampling_rate)
+    filtered_accel = filtered_channel(filename, 'accel_mag', cutoff_freq)
 
     # Detect peaks (steps)
-    # Parameters tuned to detect walking steps
-    min_peak_height = np.mean(filtered_accel) + 0.5 * np.std(filtered_accel)
-    min_distance = int(0.3 * sampling_rate)  # Minimum 0.3 seconds between steps
-
-    peaks, properties = find_peaks(filtered_accel, height=min_peak_height, distance=min_distance)
+    # Minimum peak height mean + 0.5 std, minimum 0.3 seconds between steps
+    peaks = step_peaks(filename, cutoff_freq, height_std=0.5, min_step_interval=0.3)
 
     num_steps = len(peaks)
 
-    return timestamps, accel_mag, smoothed_accel, filtered_accel, peaks, num_steps, sampling_rate
+    # Cached stages are read-only; hand out copies callers are free to modify
+    return (np.array(timestamps), np.array(accel_mag), smoothed_accel, np.array(filtered_accel),
+            np.array(peaks), num_steps, fs)
 
 def plot_step_detection(timestamps, accel_mag, filtered_accel, peaks, num_steps):
+    plt = pyplot()
+
     # Convert timestamps to seconds from start
     time_seconds = (timestamps - timestamps[0]) / 1e9
 
@@ -70,19 +58,20 @@ def plot_step_detection(timestamps, accel_mag, filtered_accel, peaks, num_steps)
     plt.savefig('plot4_step_detection.png', dpi=300)
     plt.close()
 
-def main():
+def main(filename='lab9-dataset/WALKING.csv', plots=True):
     print("Part 2: Step Detection")
     print("-" * 50)
 
     # Detect steps in WALKING.csv
-    timestamps, accel_mag, smoothed_accel, filtered_accel, peaks, num_steps, fs = detect_steps('lab9-dataset/WALKING.csv')
+    timestamps, accel_mag, smoothed_accel, filtered_accel, peaks, num_steps, fs = detect_steps(filename)
 
-    print(f"Detected {num_steps} steps in WALKING.csv")
+    print(f"Detected {num_steps} steps in {os.path.basename(filename)}")
     print(f"Sampling rate: {fs:.2f} Hz")
 
     # Create plot
-    plot_step_detection(timestamps, accel_mag, filtered_accel, peaks, num_steps)
-    print("Step detection plot saved to plot4_step_detection.png")
+    if plots:
+        plot_step_detection(timestamps, accel_mag, filtered_accel, peaks, num_steps)
+        print("Step detection plot saved to plot4_step_detection.png")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,145 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from batch_kernels import process_batch, ragged_row
+from orientation import mahony_filter, orientation_heading
+from shared_channels import SharedRecording
+from spatial_index import StepIndex
+from stage_cache import StageCache, set_default_cache
+from stages import accel_magnitude, cumulative_heading, filtered_channel
+from step_detection import detect_steps
+from trajectory_plot import detect_steps_and_turns
+from turn_detection import detect_turns
+
+@pytest.fixture(autouse=True)
+def memory_only_cache():
+    # Keep the tests independent of any on-disk stage cache
+    set_default_cache(StageCache(cache_dir=None))
+    yield
+    set_default_cache(None)
+
+def test_detect_turns_on_turning_csv():
+    # TURNING.csv has rows with 8 and 11 fields under a 10-column header
+    timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns, fs = detect_turns('lab9-dataset/TURNING.csv')
+    assert not np.isnan(gyro_z).any()
+    assert len(turns) == 8
+
+def test_detect_steps_and_turns_on_trailing_commas():
+    timestamps, step_indices, cumulative_angle_deg, fs = detect_steps_and_turns('lab9-dataset/WALKING_AND_TURNING.csv')
+    assert not np.isnan(cumulative_angle_deg).any()
+    assert len(step_indices) > 0
+
+def test_repeated_analysis_hits_stage_cache():
+    cache = StageCache(cache_dir=None)
+    set_default_cache(cache)
+    detect_steps('lab9-dataset/WALKING.csv')
+    misses = cache.stats()['misses']
+    detect_steps('lab9-dataset/WALKING.csv')
+    assert cache.stats()['misses'] == misses
+
+def split_csv(source, tmp_path, parts):
+    # Equal-length recordings cut from one file, so they share its sampling rate
+    with open(source) as f:
+        header, *rows = f.readlines()
+    n = len(rows) // parts
+    paths = []
+    for i in range(parts):
+        path = tmp_path / f'part{i}.csv'
+        path.write_text(header + ''.join(rows[i * n:(i + 1) * n]))
+        paths.append(str(path))
+    return paths
+
+def test_batched_kernels_match_per_file_detection(tmp_path):
+    filenames = split_csv('lab9-dataset/WALKING_AND_TURNING.csv', tmp_path, 2)
+    result = process_batch(filenames)
+    for i, filename in enumerate(filenames):
+        peaks = detect_steps(filename)[4]
+        turns = detect_turns(filename)[4]
+        np.testing.assert_array_equal(ragged_row(result['step_offsets'], result['step_indices'], i), peaks)
+        np.testing.assert_array_equal(ragged_row(result['turn_offsets'], result['turn_indices'], i),
+                                      [turn['index'] for turn in turns])
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_shared_recording_matches_serial_stages(workers):
+    filename = 'lab9-dataset/WALKING_AND_TURNING.csv'
+    with SharedRecording.from_csv(filename, chunk_rows=1000) as shared:
+        shared.process(workers, chunk_size=1000)
+        np.testing.assert_allclose(shared['accel_mag'], accel_magnitude(filename))
+        np.testing.assert_allclose(shared['filtered_accel_mag'], filtered_channel(filename, 'accel_mag', 3.0))
+        np.testing.assert_allclose(shared['filtered_gyro_z'], filtered_channel(filename, 'gyro_z', 1.0))
+        np.testing.assert_allclose(shared['heading_deg'], cumulative_heading(filename, 1.0), atol=1e-9)
+
+def test_shared_workers_trajectory_matches_cached_stages():
+    filename = 'lab9-dataset/WALKING_AND_TURNING.csv'
+    _, step_indices, cumulative_angle_deg, _ = detect_steps_and_turns(filename)
+    _, shared_steps, shared_angle_deg, _ = detect_steps_and_turns(filename, shared_workers=2)
+    np.testing.assert_array_equal(shared_steps, step_indices)
+    np.testing.assert_allclose(shared_angle_deg, cumulative_angle_deg, atol=1e-9)
+
+def random_step_index(rng):
+    # Two batches, so queries see both the main and the pending segment
+    index = StepIndex(cell_size=2.0, merge_fraction=0.5)
+    sessions = [(f'session{i}', rng.uniform(-20, 20, 200), rng.uniform(-20, 20, 200),
+                 np.arange(200.0), rng.uniform(0, 360, 200)) for i in range(6)]
+    index.add_sessions(sessions[:5])
+    index.add_sessions(sessions[5:])
+    assert len(index._keys) and len(index._pending_keys)
+    return index, sessions
+
+def test_step_index_queries_match_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    index, sessions = random_step_index(rng)
+    queries = [(rng.uniform(-25, 25), rng.uniform(-25, 25), rng.uniform(0.5, 8),
+                rng.uniform(-25, 25), rng.uniform(-25, 25), rng.uniform(0, 10)) for _ in range(20)]
+
+    def check(queried):
+        for x, y, radius, xmin, ymin, size in queries:
+            xmax, ymax = xmin + size, ymin + size
+            expected = {(i, t) for i, (_, sx, sy, times, _) in enumerate(sessions)
+                        for t in times[(sx - x)**2 + (sy - y)**2 <= radius**2]}
+            steps = queried.within_radius(x, y, radius)
+            assert set(zip(steps['session'].tolist(), steps['time'].tolist())) == expected
+            assert len(steps['x']) == len(expected)
+
+            expected_box = [name for name, sx, sy, _, _ in sessions
+                            if np.any((sx >= xmin) & (sx <= xmax) & (sy >= ymin) & (sy <= ymax))]
+            assert queried.sessions_in_box(xmin, ymin, xmax, ymax) == expected_box
+
+    check(index)
+
+    # save() merges the pending segment; the loaded index must answer the same
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+    loaded = StepIndex.load(path)
+    assert loaded.sessions == index.sessions and len(loaded) == len(index)
+    check(loaded)
+
+def synthetic_imu(rng, n_recordings=3, n_samples=400):
+    # Phone roughly flat and turning, with a hard-iron offset and gaps
+    gyro = rng.normal(0.0, 0.3, (n_recordings, n_samples, 3))
+    accel = np.array([0.0, 0.0, 9.81]) + rng.normal(0.0, 0.5, (n_recordings, n_samples, 3))
+    mag = np.array([25.0, 5.0, -40.0]) + rng.normal(0.0, 1.0, (n_recordings, n_samples, 3))
+    accel[:, 50] = np.nan
+    mag[:, 60:70] = np.nan
+    timestamps = np.cumsum(rng.integers(9_000_000, 11_000_000, (n_recordings, n_samples)), axis=1)
+    return gyro, accel, mag, timestamps
+
+@pytest.mark.parametrize('use_mag', [False, True])
+def test_mahony_numba_matches_numpy(use_mag):
+    pytest.importorskip('numba')
+    gyro, accel, mag, timestamps = synthetic_imu(np.random.default_rng(0))
+    expected = mahony_filter(gyro, accel, mag, timestamps, use_mag=use_mag, use_numba=False)
+    q = mahony_filter(gyro, accel, mag, timestamps, use_mag=use_mag, use_numba=True)
+    assert not np.isnan(q).any()
+    np.testing.assert_allclose(q, expected, atol=1e-8)
+
+def test_orientation_heading_follows_gyro_heading_when_flat():
+    # TURNING.csv is recorded with the phone held flat
+    filename = 'lab9-dataset/TURNING.csv'
+    gyro_heading = detect_turns(filename)[3]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # NumPy fallback without numba
+        heading = orientation_heading(filename)
+    assert abs(heading[-1] - gyro_heading[-1]) < 5.0
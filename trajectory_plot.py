@@ -1,53 +1,41 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
-from scipy.signal import butter, filtfilt, find_peaks
-
-def lowpass_filter(data, cutoff_freq, sampling_rate, order=4):
-    # Butterworth low-pass filter
-    nyquist = 0.5 * sampling_rate
-    normal_cutoff = cutoff_freq / nyquist
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    filtered_data = filtfilt(b, a, data)
-    return filtered_data
-
-def detect_steps_and_turns(filename):
-    # Read data - trailing commas cause pandas to use first column as index
-    df = pd.read_csv(filename)
-    df = df.reset_index()
-    # After reset: 'index' has timestamps, other columns are shifted left by 1
-    timestamps = df['index'].values
-    accel_x = df['timestamp'].values  # Actually accel_x
-    accel_y = df['accel_x'].values   # Actually accel_y
-    accel_z = df['accel_y'].values   # Actually accel_z
-    gyro_z = df['gyro_y'].values     # Actually gyro_z
-
-    # Calculate sampling rate
-    dt = np.mean(np.diff(timestamps)) / 1e9
-    sampling_rate = 1.0 / dt
 
-    # Step detection
-    accel_mag = np.sqrt(accel_x**2 + accel_y**2 + accel_z**2)
-    filtered_accel = lowpass_filter(accel_mag, 3.0, sampling_rate)
+from plotting import pyplot
+
+from stages import load_recording, sampling_rate, step_peaks, cumulative_heading, find_steps
+
+def detect_steps_and_turns(filename, heading='gyro_z', shared_workers=None):
+    # Shares the memoized stages with step_detection and turn_detection, so
+    # the magnitude, filters, peak search and integration are computed once.
+    # heading='orientation' uses the full 3-D orientation filter instead of
+    # integrating gyro_z, which is only valid while the phone is held flat.
+    # shared_workers processes very long recordings in parallel over shared
+    # memory instead (see shared_channels.py), bypassing the stage cache
+    if shared_workers:
+        if heading != 'gyro_z':
+            raise ValueError("shared_workers only supports heading='gyro_z'")
+        from shared_channels import process_recording_shared
 
-    min_peak_height = np.mean(filtered_accel) + 0.5 * np.std(filtered_accel)
-    min_distance = int(0.3 * sampling_rate)
-    step_indices, _ = find_peaks(filtered_accel, height=min_peak_height, distance=min_distance)
+        channels = process_recording_shared(filename, shared_workers)
+        fs = channels['sampling_rate']
+        step_indices = find_steps(channels['filtered_accel_mag'], fs, height_std=0.5, min_step_interval=0.3)
+        return channels['timestamp'], step_indices, channels['heading_deg'], fs
 
-    # Turn detection using gyroscope
-    filtered_gyro_z = lowpass_filter(gyro_z, 1.0, sampling_rate)
+    timestamps = load_recording(filename)['timestamp']
+    fs = sampling_rate(filename)
 
-    # Integrate gyroscope to get cumulative angle
-    cumulative_angle = np.zeros(len(timestamps))
-    dt_array = np.diff(timestamps) / 1e9
-    for i in range(1, len(timestamps)):
-        cumulative_angle[i] = cumulative_angle[i-1] + filtered_gyro_z[i-1] * dt_array[i-1]
+    # Step detection
+    step_indices = step_peaks(filename, cutoff_freq=3.0, height_std=0.5, min_step_interval=0.3)
 
-    cumulative_angle_deg = np.degrees(cumulative_angle)
+    # Turn detection using gyroscope, integrated to cumulative angle
+    if heading == 'orientation':
+        from orientation import orientation_heading
+        cumulative_angle_deg = orientation_heading(filename)
+    else:
+        cumulative_angle_deg = cumulative_heading(filename, cutoff_freq=1.0)
 
-    return timestamps, step_indices, cumulative_angle_deg, sampling_rate
+    # Cached stages are read-only; hand out copies callers are free to modify
+    return np.array(timestamps), np.array(step_indices), np.array(cumulative_angle_deg), fs
 
 def create_trajectory(step_indices, cumulative_angle_deg):
     # Start at origin facing north (90 degrees)
@@ -75,6 +63,8 @@ def create_trajectory(step_indices, cumulative_angle_deg):
     return trajectory_x, trajectory_y
 
 def plot_trajectory(trajectory_x, trajectory_y, num_steps):
+    plt = pyplot()
+
     plt.figure(figsize=(10, 10))
     plt.plot(trajectory_x, trajectory_y, 'b-', linewidth=2, label='Walking Path')
     plt.plot(trajectory_x[0], trajectory_y[0], 'go', markersize=15, label='Start')
@@ -94,12 +84,12 @@ def plot_trajectory(trajectory_x, trajectory_y, num_steps):
     plt.savefig('plot6_trajectory.png', dpi=300)
     plt.close()
 
-def main():
+def main(filename='lab9-dataset/WALKING_AND_TURNING.csv', plots=True, heading='gyro_z', shared_workers=None):
     print("Part 4: Trajectory Plotting")
     print("-" * 50)
 
     # Process WALKING_AND_TURNING.csv
-    timestamps, step_indices, cumulative_angle_deg, fs = detect_steps_and_turns('lab9-dataset/WALKING_AND_TURNING.csv')
+    timestamps, step_indices, cumulative_angle_deg, fs = detect_steps_and_turns(filename, heading, shared_workers)
 
     num_steps = len(step_indices)
     print(f"Detected {num_steps} steps")
@@ -109,9 +99,9 @@ def main():
     trajectory_x, trajectory_y = create_trajectory(step_indices, cumulative_angle_deg)
 
     # Plot trajectory
-    plot_trajectory(trajectory_x, trajectory_y, num_steps)
-
-    print(f"Trajectory plot saved to plot6_trajectory.png")
+    if plots:
+        plot_trajectory(trajectory_x, trajectory_y, num_steps)
+        print(f"Trajectory plot saved to plot6_trajectory.png")
     print(f"Final position: ({trajectory_x[-1]:.2f}, {trajectory_y[-1]:.2f}) meters")
 
 if __name__ == "__main__":
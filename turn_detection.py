@@ -1,41 +1,25 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
-from scipy.signal import butter, filtfilt
-
-def lowpass_filter(data, cutoff_freq, sampling_rate, order=4):
-    # Butterworth low-pass filter
-    nyquist = 0.5 * sampling_rate
-    normal_cutoff = cutoff_freq / nyquist
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    filtered_data = filtfilt(b, a, data)
-    return filtered_data
 
-def detect_turns(filename):
-    # Read only specific columns we need to avoid inconsistent column issues
-    df = pd.read_csv(filename, usecols=['timestamp', 'gyro_z'])
+from plotting import pyplot
+
+from stages import load_recording, filtered_channel, cumulative_heading
+from stages import sampling_rate as recording_sampling_rate
 
-    timestamps = df['timestamp'].values
-    gyro_z = df['gyro_z'].values
+def detect_turns(filename):
+    # Read data and shared stages (memoized, see stages.py)
+    recording = load_recording(filename)
+    timestamps = recording['timestamp']
+    gyro_z = recording['gyro_z']
 
     # Calculate sampling rate
-    dt_ns = np.diff(timestamps)
-    dt = dt_ns / 1e9  # Convert to seconds
-    sampling_rate = 1.0 / np.mean(dt)
+    sampling_rate = recording_sampling_rate(filename)
 
     # Apply smoothing to gyroscope data
     cutoff_freq = 1.0  # Hz
-    filtered_gyro_z = lowpass_filter(gyro_z, cutoff_freq, sampling_rate)
+    filtered_gyro_z = filtered_channel(filename, 'gyro_z', cutoff_freq)
 
-    # Integrate gyroscope to get angle (in radians)
-    cumulative_angle = np.zeros(len(timestamps))
-    for i in range(1, len(timestamps)):
-        cumulative_angle[i] = cumulative_angle[i-1] + filtered_gyro_z[i-1] * dt[i-1]
-
-    # Convert to degrees
-    cumulative_angle_deg = np.degrees(cumulative_angle)
+    # Integrate gyroscope to get angle, converted to degrees
+    cumulative_angle_deg = cumulative_heading(filename, cutoff_freq)
 
     # Detect 90-degree turns
     turns = []
@@ -70,9 +54,13 @@ def detect_turns(filename):
                 current_turn_start = i
                 last_turn_index = i
 
-    return timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns, sampling_rate
+    # Cached stages are read-only; hand out copies callers are free to modify
+    return (np.array(timestamps), np.array(gyro_z), np.array(filtered_gyro_z),
+            np.array(cumulative_angle_deg), turns, sampling_rate)
 
 def plot_turn_detection(timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns):
+    plt = pyplot()
+
     # Convert timestamps to seconds
     time_seconds = (timestamps - timestamps[0]) / 1e9
 
@@ -105,12 +93,12 @@ def plot_turn_detection(timestamps, gyro_z, filtered_gyro_z, cumulative_angle_de
     plt.savefig('plot5_turn_detection.png', dpi=300)
     plt.close()
 
-def main():
+def main(filename='lab9-dataset/TURNING.csv', plots=True):
     print("Part 3: Turn Detection")
     print("-" * 50)
 
     # Detect turns in TURNING.csv
-    timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns, fs = detect_turns('lab9-dataset/TURNING.csv')
+    timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns, fs = detect_turns(filename)
 
     print(f"Sampling rate: {fs:.2f} Hz")
     print(f"Detected {len(turns)} turns:")
@@ -118,8 +106,9 @@ def main():
         print(f"  Turn {i+1}: {turn['direction']}, angle = {turn['angle']:.1f}°, time = {turn['time']:.2f}s")
 
     # Create plot
-    plot_turn_detection(timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns)
-    print("\nTurn detection plot saved to plot5_turn_detection.png")
+    if plots:
+        plot_turn_detection(timestamps, gyro_z, filtered_gyro_z, cumulative_angle_deg, turns)
+        print("\nTurn detection plot saved to plot5_turn_detection.png")
 
 if __name__ == "__main__":
     main()